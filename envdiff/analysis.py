@@ -1,37 +1,87 @@
+import copy
 import json
 import logging
 import os
-import re
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 from .container import ContainerManager
-from .diff import generate_diff_report
+from .diff import (
+    generate_diff_report,
+    group_diff_sections,
+    iter_diff_report,
+    prune_excluded_files,
+    validate_exclude_paths,
+)
 import yaml
 
-logger = logging.getLogger(__name__)
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _YamlLoader
+
+try:
+    import orjson
+except ImportError:  # optional, only speeds up writing the report
+    orjson = None
 
+logger = logging.getLogger(__name__)
 
-def _merge_dicts(base: dict, new: dict) -> dict:
-    """Merge ``new`` into ``base`` following custom rules."""
+_JSON_INDENT = "    "
+_MAX_WORKERS = 8
+_STR_BATCH_SIZE = 4096
+# Buffer size for writing the report, so large reports need few write calls.
+_REPORT_BUFFER_SIZE = 1 << 20
+_YAML_CACHE_SIZE = 32
+# Parsed YAML files keyed by (st_dev, st_ino, st_mtime_ns, st_size).
+_yaml_cache: dict = {}
+# Scalar types of parsed YAML that are returned as is when copying documents.
+_IMMUTABLE_SCALARS = frozenset({str, int, float, bool, type(None)})
+# Top-level list entries that are deduplicated while merging configurations.
+_DEDUP_KEYS = frozenset({"target_dirs", "exclude_paths", "omit_diff_paths"})
+
+
+def _merge_dicts(base: dict, new: dict, dedup_keys: frozenset = frozenset()) -> dict:
+    """Merge ``new`` into ``base`` following custom rules.
+
+    ``base`` is updated in place. ``new`` is never modified, but its lists and
+    dictionaries are shared with ``base`` rather than copied; a nested
+    dictionary is only copied when both sides define it and it has to be
+    merged. Lists stored under ``dedup_keys`` have duplicate entries removed,
+    keeping the first occurrence.
+    """
+    if not base:
+        # Nothing to merge against: every value would be taken as-is anyway.
+        base.update(new)
+        _dedup_lists(base, dedup_keys)
+        return base
     for key, value in new.items():
+        existing = base.get(key)
         if isinstance(value, list):
-            existing = base.get(key)
             if isinstance(existing, list):
-                base[key] = existing + value
-            else:
-                base[key] = list(value)
+                value = existing + value
+            if key in dedup_keys:
+                value = list(dict.fromkeys(value))
+            base[key] = value
         elif isinstance(value, dict):
-            if isinstance(base.get(key), dict):
-                base[key] = _merge_dicts(base[key], value)
+            if isinstance(existing, dict):
+                base[key] = _merge_dicts(dict(existing), value)
             else:
-                base[key] = _merge_dicts({}, value)
+                base[key] = value
         else:
             base[key] = value
     return base
 
 
+def _dedup_lists(config: dict, keys: frozenset) -> None:
+    """Remove duplicate entries from the lists under ``keys``, keeping the first one."""
+    for key in keys & config.keys():
+        if isinstance(config[key], list):
+            config[key] = list(dict.fromkeys(config[key]))
+
+
 def _resolve_relative_paths(config: dict, base_dir: Path, root_dir: Path) -> None:
     """Resolve relative file paths inside ``config``.
 
@@ -45,69 +95,251 @@ def _resolve_relative_paths(config: dict, base_dir: Path, root_dir: Path) -> Non
         for entry in copy_files:
             if isinstance(entry, dict) and "src" in entry:
                 src_path = Path(entry["src"])
-                if not src_path.is_absolute():
-                    abs_path = (base_dir / src_path).resolve()
-                    entry["src"] = os.path.relpath(abs_path, root_dir)
+                if src_path.is_absolute():
+                    continue
+                if ".." in src_path.parts:
+                    # ".." must be applied after following symlinks, as the
+                    # kernel does, so only a full resolve() is correct here.
+                    abs_path = str((base_dir / src_path).resolve())
+                else:
+                    abs_path = os.path.normpath(os.path.join(base_dir, src_path))
+                entry["src"] = os.path.relpath(abs_path, root_dir)
+
+
+def _absolute_src_path(path: Path) -> Path:
+    """Return ``path`` made absolute like ``Path.resolve()`` would for a copy source.
+
+    Only ``..`` components and a symlink as the last component change what is
+    copied, and under which name; other paths are normalized lexically, which
+    avoids a system call per path component.
+    """
+    if ".." in path.parts or os.path.islink(path):
+        return path.resolve()
+    return Path(os.path.abspath(path))
+
+
+def _dumps_str(value: str) -> str:
+    """Encode ``value`` as a JSON string literal without escaping non-ASCII."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except orjson.JSONEncodeError:  # lone surrogates
+            pass
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _encode_str_batch(batch: list, inner: str) -> str:
+    """Return the JSON strings in ``batch``, each preceded by ``inner``, comma-separated."""
+    if orjson is not None:
+        try:
+            text = orjson.dumps(batch, option=orjson.OPT_INDENT_2).decode("utf-8")
+        except orjson.JSONEncodeError:  # lone surrogates
+            pass
+        else:
+            # Encoded strings never contain a raw newline, so every "\n  "
+            # starts an item.
+            return text[1:-2].replace("\n  ", inner)
+    return inner + ("," + inner).join(map(_dumps_str, batch))
+
 
+def _write_str_list(f, items: list, level: int) -> None:
+    """Write a non-empty list of strings as an indented JSON array.
+
+    Diff reports are long lists of strings; encoding them in batches avoids a
+    recursive :func:`_write_json` call and two writes per line.
+    """
+    inner = "\n" + _JSON_INDENT * (level + 1)
+    f.write("[")
+    for start in range(0, len(items), _STR_BATCH_SIZE):
+        if start:
+            f.write(",")
+        f.write(_encode_str_batch(items[start:start + _STR_BATCH_SIZE], inner))
+    f.write("\n" + _JSON_INDENT * level + "]")
 
-def load_config(config_path: Path, *, _root_dir: Path | None = None) -> dict:
+
+def _write_json(f, value, level: int = 0, depth: int = 3) -> None:
+    """Write ``value`` to ``f`` as JSON indented by four spaces.
+
+    The output matches ``json.dump(value, f, indent=4, ensure_ascii=False)``,
+    but containers down to ``depth`` levels are written one element at a time
+    so that the serialized report is never held in memory as a whole.
+    """
+    if depth and value and isinstance(value, list) and all(type(item) is str for item in value):
+        _write_str_list(f, value, level)
+        return
+    streamable = isinstance(value, list) or (
+        isinstance(value, dict) and all(isinstance(key, str) for key in value)
+    )
+    if depth and value and streamable:
+        inner = "\n" + _JSON_INDENT * (level + 1)
+        is_dict = isinstance(value, dict)
+        f.write("{" if is_dict else "[")
+        items = value.items() if is_dict else enumerate(value)
+        for i, (key, item) in enumerate(items):
+            f.write("," + inner if i else inner)
+            if is_dict:
+                f.write(_dumps_str(key) + ": ")
+            _write_json(f, item, level + 1, depth - 1)
+        f.write("\n" + _JSON_INDENT * level + ("}" if is_dict else "]"))
+    elif isinstance(value, str):
+        f.write(_dumps_str(value))
+    else:
+        text = json.dumps(value, indent=4, ensure_ascii=False)
+        if level:
+            text = text.replace("\n", "\n" + _JSON_INDENT * level)
+        f.write(text)
+
+
+def _copy_document(value):
+    """Return a deep copy of a parsed YAML document.
+
+    Much faster than :func:`copy.deepcopy` for the dicts, lists and scalars a
+    configuration consists of; anything else is handed to ``deepcopy``.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {key: _copy_document(item) for key, item in value.items()}
+    if value_type is list:
+        return [_copy_document(item) for item in value]
+    if value_type in _IMMUTABLE_SCALARS:
+        return value
+    return copy.deepcopy(value)
+
+
+def _parse_yaml(f) -> dict:
+    """Parse the open YAML file ``f``.
+
+    The parsed document is kept while the file's inode, modification time and
+    size are unchanged, so repeated loads of the same configuration skip the
+    YAML parser. Callers always receive a private deep copy because the result
+    is modified while resolving and merging configurations. Objects shared
+    through YAML anchors are copied separately.
+    """
+    st = os.fstat(f.fileno())
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+    document = _yaml_cache.get(key)
+    if document is None:
+        document = yaml.load(f, Loader=_YamlLoader) or {}
+        if len(_yaml_cache) >= _YAML_CACHE_SIZE:
+            _yaml_cache.pop(next(iter(_yaml_cache)))
+        _yaml_cache[key] = document
+    return _copy_document(document)
+
+
+def load_config(
+    config_path: Path,
+    *,
+    _root_dir: Path | None = None,
+    _cache: dict[Path, dict] | None = None,
+) -> dict:
     """Load YAML configuration from the given path, processing ``extends``.
 
     ``_root_dir`` is used internally to keep track of the directory of the
     original configuration file specified by the user. Relative paths in nested
     configuration files are converted so that they remain relative to this root
     directory.
+
+    ``_cache`` maps resolved paths of extended files to their loaded
+    configuration so that a file shared by several ``extends`` entries is only
+    read and parsed once per top-level call.
     """
     logger.info(f"Loading configuration from '{config_path}'...")
-    if not config_path.is_file():
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = _parse_yaml(f)
+    except (FileNotFoundError, IsADirectoryError):
         logger.error(f"Configuration file not found: {config_path}")
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f) or {}
+        raise FileNotFoundError(f"Configuration file not found: {config_path}") from None
 
+    if _cache is None:
+        _cache = {}
     if _root_dir is None:
         _root_dir = config_path.parent
 
     _resolve_relative_paths(config, config_path.parent, _root_dir)
 
-    combined: dict = {}
-    extends_list = config.get("extends", [])
+    extends_list = config.pop("extends", [])
     if isinstance(extends_list, str):
         extends_list = [extends_list]
 
-    for ext in extends_list:
-        ext_path = Path(ext)
-        if not ext_path.is_absolute():
-            ext_path = config_path.parent / ext_path
-        ext_path = ext_path.resolve()
-        extended_cfg = load_config(ext_path, _root_dir=_root_dir)
-        combined = _merge_dicts(combined, extended_cfg)
-
-    config.pop("extends", None)
-    combined = _merge_dicts(combined, config)
+    if extends_list:
+        combined: dict = {}
+        for ext in extends_list:
+            ext_path = Path(ext)
+            if not ext_path.is_absolute():
+                ext_path = config_path.parent / ext_path
+            ext_path = ext_path.resolve()
+            extended_cfg = _cache.get(ext_path)
+            if extended_cfg is None:
+                extended_cfg = load_config(ext_path, _root_dir=_root_dir, _cache=_cache)
+                _cache[ext_path] = extended_cfg
+            combined = _merge_dicts(combined, extended_cfg, _DEDUP_KEYS)
+        combined = _merge_dicts(combined, config, _DEDUP_KEYS)
+    else:
+        # Nothing to merge: the parsed document is already private to this call.
+        combined = config
+        _dedup_lists(combined, _DEDUP_KEYS)
 
     title = combined.get("title")
     if isinstance(title, str):
         combined["title"] = " ".join(title.splitlines())
 
-    # Remove duplicates from specific list entries
-    def _dedup(seq: list) -> list:
-        seen = set()
-        result = []
-        for item in seq:
-            if item not in seen:
-                seen.add(item)
-                result.append(item)
-        return result
-
-    for key in ("target_dirs", "exclude_paths", "omit_diff_paths"):
-        if isinstance(combined.get(key), list):
-            combined[key] = _dedup(combined[key])
-
     logger.info("Configuration loaded successfully.")
     return combined
 
 
+def _map_concurrently(func, items: list) -> list:
+    """Return ``[func(item) for item in items]`` computed by a thread pool.
+
+    Used for work that mostly waits on subprocesses (container commands,
+    ``diff``), so threads overlap the waiting without contending for the GIL.
+    """
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+def _capture_command_outputs(cm: ContainerManager, entries: list, outfiles: list) -> set:
+    """Capture the output of each ``command_diff`` entry into the matching file.
+
+    Entries sharing an output file are captured one after another in config
+    order, so the last one wins as it did before captures ran concurrently.
+    Returns the set of files written; a failed capture raises instead.
+    """
+    commands_by_outfile: dict = {}
+    for entry, outfile in zip(entries, outfiles):
+        commands_by_outfile.setdefault(outfile, []).append(entry["command"])
+
+    def capture(outfile: Path) -> None:
+        for command in commands_by_outfile[outfile]:
+            cm.capture_command_output(command, outfile)
+
+    _map_concurrently(capture, list(commands_by_outfile))
+    return set(commands_by_outfile)
+
+
+def _filesystem_rq_diff(base_fs_root: Path, after_fs_root: Path, exclude_paths: list) -> list:
+    """Return the non-empty lines of the ``diff -rq`` report."""
+    return [line for line in iter_diff_report(base_fs_root, after_fs_root, "rq", exclude_paths) if line]
+
+
+def _filesystem_urn_diff(
+    base_fs_root: Path, after_fs_root: Path, exclude_paths: list, omit_diff_paths: list
+) -> list:
+    """Return the ``diff -urN`` report split into one entry per file."""
+    lines = iter_diff_report(base_fs_root, after_fs_root, "urN", exclude_paths, omit_diff_paths)
+    return group_diff_sections(lines)
+
+
+def _diff_command_outputs(files: tuple, captured: set) -> str | None:
+    """Return the text diff of a baseline/after output pair, if both were captured."""
+    base_cmd_file, after_cmd_file = files
+    if base_cmd_file in captured and after_cmd_file in captured:
+        return generate_diff_report(base_cmd_file, after_cmd_file, "text")
+    return None
+
+
 def run_analysis(config_path: Path, output_report_path: Path, container_tool: str):
     """Main analysis workflow."""
     config = load_config(config_path)
@@ -118,6 +350,11 @@ def run_analysis(config_path: Path, output_report_path: Path, container_tool: st
     if not base_image:
         logger.error("Configuration error: 'base_image' not specified in input YAML.")
         raise ValueError("'base_image' must be defined in the configuration.")
+    try:
+        validate_exclude_paths(config.get("exclude_paths", []))
+    except ValueError as e:
+        logger.error(f"Configuration error: {e}")
+        raise
 
     output_data = {
         "report_metadata": {
@@ -137,14 +374,16 @@ def run_analysis(config_path: Path, output_report_path: Path, container_tool: st
 
     with ContainerManager(image_name=base_image, container_tool=container_tool) as cm:
         logger.info("--- Preparing Container ---")
+        copy_entries = []
         for entry in config.get("prepare", {}).get("copy_files", []):
             src_path = Path(entry["src"])
             if not src_path.is_absolute():
-                src_path = (root_dir / src_path).resolve()
+                src_path = _absolute_src_path(root_dir / src_path)
             if not src_path.exists():
                 logger.error(f"Source file for copy not found: {src_path}. Skipping this copy operation.")
                 continue
-            cm.copy_to(src_path, entry["dest"])
+            copy_entries.append((src_path, entry["dest"]))
+        cm.copy_many_to(copy_entries)
 
         cm.start()
 
@@ -168,12 +407,16 @@ def run_analysis(config_path: Path, output_report_path: Path, container_tool: st
             if not target_dirs:
                 logger.warning("'target_dirs' not specified in config. File system diffs might be empty or limited.")
 
+            command_diff = config.get("command_diff", [])
+            cmd_file_pairs = []
+            for entry in command_diff:
+                outfile_name = Path(entry["outfile"]).name
+                cmd_file_pairs.append((base_cmd_output_dir / outfile_name, after_cmd_output_dir / outfile_name))
+
             logger.info("--- Capturing Baseline State ---")
             if target_dirs:
                 cm.export_paths(target_dirs, base_fs_root)
-            for entry in config.get("command_diff", []):
-                outfile_name = Path(entry["outfile"]).name
-                cm.capture_command_output(entry["command"], base_cmd_output_dir / outfile_name)
+            captured = _capture_command_outputs(cm, command_diff, [base for base, _ in cmd_file_pairs])
             logger.info("--- Baseline State Captured ---")
 
             logger.info("--- Executing Main Operation ---")
@@ -186,34 +429,35 @@ def run_analysis(config_path: Path, output_report_path: Path, container_tool: st
             logger.info("--- Capturing State After Main Operation ---")
             if target_dirs:
                 cm.export_paths(target_dirs, after_fs_root)
-            for entry in config.get("command_diff", []):
-                outfile_name = Path(entry["outfile"]).name
-                cm.capture_command_output(entry["command"], after_cmd_output_dir / outfile_name)
+            captured |= _capture_command_outputs(cm, command_diff, [after for _, after in cmd_file_pairs])
             logger.info("--- State After Main Operation Captured ---")
+            # The container is not needed for diffing; remove it in the meantime.
+            cm.cleanup_in_background()
 
             logger.info("--- Generating Diff Reports ---")
             exclude_paths = config.get("exclude_paths", [])
             omit_diff_paths = config.get("omit_diff_paths", [])
+            if target_dirs and exclude_paths:
+                try:
+                    prune_excluded_files(base_fs_root, after_fs_root, exclude_paths)
+                except OSError as e:
+                    logger.warning(f"Could not remove excluded files before diffing: {e}")
+
+            # The filesystem and command diffs are independent diff processes,
+            # so they all run at once.
+            with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+                if target_dirs:
+                    rq_future = executor.submit(
+                        _filesystem_rq_diff, base_fs_root, after_fs_root, exclude_paths
+                    )
+                    urn_future = executor.submit(
+                        _filesystem_urn_diff, base_fs_root, after_fs_root, exclude_paths, omit_diff_paths
+                    )
+                cmd_diff_futures = [executor.submit(_diff_command_outputs, pair, captured) for pair in cmd_file_pairs]
 
             if target_dirs:
-                fs_diff_rq_content = generate_diff_report(
-                    base_fs_root, after_fs_root, "rq", exclude_paths
-                )
-                output_data["diff_reports"]["filesystem_rq"] = list(filter(None, fs_diff_rq_content.split("\n")))
-
-                fs_diff_urn_content = generate_diff_report(
-                    base_fs_root,
-                    after_fs_root,
-                    "urN",
-                    exclude_paths,
-                    omit_diff_paths,
-                )
-                output_data["diff_reports"]["filesystem_urN"] = list(
-                    map(
-                        lambda l: l[:-1],
-                        filter(None, re.split(r"(?=^[a-zA-Z].+$)", fs_diff_urn_content, flags=re.MULTILINE))
-                    )
-                )
+                output_data["diff_reports"]["filesystem_rq"] = rq_future.result()
+                output_data["diff_reports"]["filesystem_urN"] = urn_future.result()
             else:
                 logger.info("Skipping filesystem diffs as 'target_dirs' was empty.")
                 output_data["diff_reports"]["filesystem_rq"] = [
@@ -223,24 +467,22 @@ def run_analysis(config_path: Path, output_report_path: Path, container_tool: st
                     "Skipped: 'target_dirs' was not specified or empty in config."
                 ]
 
-            for entry in config.get("command_diff", []):
-                outfile_name = Path(entry["outfile"]).name
-                base_cmd_file = base_cmd_output_dir / outfile_name
-                after_cmd_file = after_cmd_output_dir / outfile_name
-
+            cmd_diff_contents = [future.result() for future in cmd_diff_futures]
+            for entry, (base_cmd_file, after_cmd_file), cmd_diff_content in zip(
+                command_diff, cmd_file_pairs, cmd_diff_contents
+            ):
                 command_diff_entry = {
                     "command": entry["command"],
                     "diff_file": entry["outfile"],
                     "diff_content": None,
                 }
-                if base_cmd_file.exists() and after_cmd_file.exists():
-                    cmd_diff_content = generate_diff_report(base_cmd_file, after_cmd_file, "text")
+                if cmd_diff_content is not None:
                     command_diff_entry["diff_content"] = cmd_diff_content[:-1]
                 else:
                     missing_files_info = []
-                    if not base_cmd_file.exists():
+                    if base_cmd_file not in captured:
                         missing_files_info.append(f"baseline output '{base_cmd_file}'")
-                    if not after_cmd_file.exists():
+                    if after_cmd_file not in captured:
                         missing_files_info.append(f"after output '{after_cmd_file}'")
                     logger.warning(
                         f"Skipping diff for command '{entry['command']}' due to missing output files: {', '.join(missing_files_info)}"
@@ -254,6 +496,6 @@ def run_analysis(config_path: Path, output_report_path: Path, container_tool: st
 
     logger.info(f"Writing final JSON report to '{output_report_path}'...")
     output_report_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_report_path, "w", encoding="utf-8") as f_report:
-        json.dump(output_data, f_report, indent=4, ensure_ascii=False)
+    with open(output_report_path, "w", encoding="utf-8", buffering=_REPORT_BUFFER_SIZE) as f_report:
+        _write_json(f_report, output_data)
     logger.info(f"✅ Environment diff report successfully generated: {output_report_path.resolve()}")
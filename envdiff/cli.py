@@ -15,6 +15,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _positive_int(value: str) -> int:
+    """Parse a command line value that must be an integer of at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description=(
@@ -49,6 +60,11 @@ def main() -> None:
         type=Path,
         help="File to save the human readable report. Defaults to stdout if omitted.",
     )
+    parser.add_argument(
+        "--max-lines",
+        type=_positive_int,
+        help="Truncate the --summarize output after this many lines.",
+    )
     parser.add_argument(
         "--verbose",
         "-v",
@@ -71,7 +87,7 @@ def main() -> None:
 
     try:
         if args.summarize:
-            text = json_report_to_text(args.summarize)
+            text = json_report_to_text(args.summarize, max_lines=args.max_lines)
             if args.text_output:
                 args.text_output.parent.mkdir(parents=True, exist_ok=True)
                 with open(args.text_output, "w", encoding="utf-8") as f:
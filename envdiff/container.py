@@ -1,13 +1,179 @@
+import os
+import posixpath
+import re
+import selectors
+import shlex
 import subprocess
+import tarfile
+import tempfile
+import threading
 import time
 import logging
+import uuid
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
 
 DEFAULT_CONTAINER_TOOL = "podman"
+# Pipe buffer requested for tar streams; 1 MiB is the default unprivileged
+# maximum on Linux (/proc/sys/fs/pipe-max-size).
+_PIPE_SIZE = 1 << 20
+# Backoff bounds (seconds) when polling the container state.
+_POLL_INITIAL_DELAY = 0.05
+_POLL_MAX_DELAY = 1.0
 
 logger = logging.getLogger(__name__)
 
+
+def _decode_output(data: bytes) -> str:
+    """Decode command output as UTF-8 and normalize line endings to ``\\n``.
+
+    Invalid bytes are replaced with U+FFFD instead of raising, and ``\\r\\n``
+    and lone ``\\r`` become ``\\n`` like universal newlines mode.
+    """
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _encode_output(data: bytes) -> bytes:
+    """Return the UTF-8 encoding of ``_decode_output(data)``.
+
+    Output that is already valid UTF-8 without carriage returns is returned
+    as is, without being decoded and encoded again.
+    """
+    if b"\r" not in data:
+        if data.isascii():
+            return data
+        try:
+            data.decode("utf-8")
+            return data
+        except UnicodeDecodeError:
+            pass
+    return _decode_output(data).encode("utf-8")
+
+
+def _grow_pipe(pipe) -> None:
+    """Enlarge the kernel buffer of ``pipe`` where supported (Linux).
+
+    Large tar streams then need fewer context switches between the two ends.
+    Failures are ignored; the default pipe size still works.
+    """
+    if fcntl is None or not hasattr(fcntl, "F_SETPIPE_SZ"):
+        return
+    try:
+        fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, _PIPE_SIZE)
+    except OSError:
+        pass
+
+
+def _format_command(cmd_list) -> str:
+    """Render a command for log messages."""
+    return ' '.join(cmd_list) if isinstance(cmd_list, list) else cmd_list
+
+
+def _independent_destinations(raw_dests: List[str], dests: List[str]) -> bool:
+    """Return whether copies to ``dests`` cannot affect each other's placement.
+
+    ``dests`` are the normalized absolute forms of ``raw_dests``. A trailing
+    slash changes how ``cp`` treats a missing destination, so such entries
+    are not considered independent either.
+    """
+    if any(dest.endswith(("/", "/.")) for dest in raw_dests):
+        return False
+    unique = set(dests)
+    if len(unique) != len(dests):
+        return False
+    for dest in dests:
+        parent = posixpath.dirname(dest)
+        while parent != dest:
+            if parent in unique:
+                return False
+            dest, parent = parent, posixpath.dirname(parent)
+    return True
+
+
+class _ShellSession:
+    """A long-running ``bash`` process that runs commands sent over its stdin.
+
+    Every command is executed as ``bash -c COMMAND </dev/null`` by the session
+    shell, so commands keep the isolation of separate ``exec`` calls (no shared
+    working directory or variables, no access to the session's stdin) while
+    the container runtime is only entered once. A command writes to pipes of
+    its own that are relayed to the session's stdout and stderr; like with a
+    separate ``exec``, it is complete once every process holding them, such
+    as a background child, has exited or closed them. Output of background
+    processes therefore never mixes into the output of later commands. The
+    end of a command's output is recognised by a random marker printed to
+    stdout, together with the exit code, and to stderr.
+    """
+
+    def __init__(self, argv: List[str]):
+        self._marker = f"__ENVDIFF_{uuid.uuid4().hex}__".encode()
+        self._stdout_end = re.compile(b"\n" + self._marker + rb":(\d+)\n")
+        self._stderr_end = b"\n" + self._marker + b"\n"
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0
+        )
+
+    def run(self, command: str) -> Tuple[int, bytes, bytes]:
+        """Run ``command`` and return its exit code, stdout and stderr."""
+        marker = self._marker.decode()
+        # stdout goes through fd 3 to the outer ``cat``, stderr to the inner one.
+        script = (
+            f"( bash -c {shlex.quote(command)} </dev/null 2>&1 >&3 3>&- | cat >&2 3>&-;"
+            f" exit \"${{PIPESTATUS[0]}}\" ) 3>&1 | cat\n"
+            f"printf '\\n%s:%d\\n' {marker} \"${{PIPESTATUS[0]}}\"\n"
+            f"printf '\\n%s\\n' {marker} >&2\n"
+        )
+        with self._lock:
+            try:
+                self._proc.stdin.write(script.encode())
+            except BrokenPipeError:
+                raise RuntimeError("Container shell session terminated unexpectedly.") from None
+            stdout = bytearray()
+            stderr = bytearray()
+            returncode = None
+            with selectors.DefaultSelector() as selector:
+                selector.register(self._proc.stdout, selectors.EVENT_READ, stdout)
+                selector.register(self._proc.stderr, selectors.EVENT_READ, stderr)
+                while selector.get_map():
+                    for key, _ in selector.select():
+                        chunk = os.read(key.fd, 65536)
+                        if not chunk:
+                            raise RuntimeError("Container shell session terminated unexpectedly.")
+                        buf = key.data
+                        buf += chunk
+                        tail = max(0, len(buf) - len(chunk) - len(self._marker) - 16)
+                        if buf is stdout:
+                            match = self._stdout_end.search(buf, tail)
+                            if match:
+                                returncode = int(match.group(1))
+                                del buf[match.start():]
+                                selector.unregister(key.fileobj)
+                        else:
+                            end = buf.find(self._stderr_end, tail)
+                            if end != -1:
+                                del buf[end:]
+                                selector.unregister(key.fileobj)
+        return returncode, bytes(stdout), bytes(stderr)
+
+    def close(self, timeout: float = 5) -> None:
+        """Terminate the session shell."""
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+            self._proc.wait()
+        finally:
+            self._proc.stdout.close()
+            self._proc.stderr.close()
+
+
 class ContainerManager:
     """Manage container lifecycle and operations."""
 
@@ -15,21 +181,40 @@ class ContainerManager:
         self.image_name = image_name
         self.container_tool = container_tool
         self.container_id = None
+        self._running = False
+        # Shell sessions into the container: all open ones and the idle ones.
+        # Concurrent callers each take a session, opening more on demand.
+        self._shells: List[_ShellSession] = []
+        self._idle_shells: List[_ShellSession] = []
+        self._shell_argv = None
+        self._shell_lock = threading.Lock()
+        self._cleanup_thread = None
         logger.info(f"ContainerManager initialized for image '{image_name}' using '{container_tool}'.")
 
-    def _run_command(self, cmd_list: list, check: bool = True, shell: bool = False, **kwargs) -> subprocess.CompletedProcess:
-        cmd_str = ' '.join(cmd_list) if isinstance(cmd_list, list) else cmd_list
-        logger.debug(f"Executing command: {cmd_str}")
+    def _run_command(
+        self, cmd_list: list, check: bool = True, shell: bool = False, capture: bool = True, **kwargs
+    ) -> subprocess.CompletedProcess:
+        """Run a host command.
+
+        With ``capture=False`` the command's stdout is discarded instead of
+        being read into memory; stderr is still collected for error reporting.
+        """
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Executing command: {_format_command(cmd_list)}")
         try:
             kwargs.setdefault('text', True)
-            result = subprocess.run(cmd_list, shell=shell, check=check, capture_output=True, **kwargs)
-            if result.stdout:
+            stdout = subprocess.PIPE if capture else subprocess.DEVNULL
+            result = subprocess.run(
+                cmd_list, shell=shell, check=check, stdout=stdout, stderr=subprocess.PIPE, **kwargs
+            )
+            if debug and result.stdout:
                 logger.debug(f"Stdout: {result.stdout.strip()}")
-            if result.stderr:
+            if debug and result.stderr:
                 logger.debug(f"Stderr: {result.stderr.strip()}")
             return result
         except subprocess.CalledProcessError as e:
-            logger.error(f"Command failed with exit code {e.returncode}: {cmd_str}")
+            logger.error(f"Command failed with exit code {e.returncode}: {_format_command(cmd_list)}")
             if e.stdout:
                 logger.error(f"Failed command stdout: {e.stdout.strip()}")
             if e.stderr:
@@ -37,7 +222,7 @@ class ContainerManager:
             raise
         except FileNotFoundError:
             logger.error(
-                f"Command not found: {cmd_list[0] if isinstance(cmd_list, list) else cmd_str.split()[0]}. "
+                f"Command not found: {cmd_list[0] if isinstance(cmd_list, list) else cmd_list.split()[0]}. "
                 f"Ensure '{self.container_tool}' is installed and in PATH."
             )
             raise
@@ -58,32 +243,157 @@ class ContainerManager:
             raise RuntimeError("Container must be created before starting.")
 
         logger.info(f"Starting container {self.container_id}...")
-        self._run_command([self.container_tool, "start", self.container_id])
+        self._run_command([self.container_tool, "start", self.container_id], capture=False)
 
         logger.info(f"Waiting for container {self.container_id} to be running (timeout: {timeout}s)...")
-        for _ in range(timeout):
+        if self._wait_running(timeout):
+            logger.info(f"Container {self.container_id} is now running.")
+            self._running = True
+            self._open_shell()
+            return
+        raise RuntimeError(f"Container {self.container_id} did not reach running state within {timeout} seconds.")
+
+    def _wait_running(self, timeout: float) -> bool:
+        """Block until the container is running; return False on timeout.
+
+        Podman can wait for the state change itself. Docker's ``wait`` has no
+        such condition, so its state is polled instead, with a delay that
+        starts short and backs off for slow starts.
+        """
+        deadline = time.monotonic() + timeout
+        if self.container_tool == "podman":
+            wait_cmd = [self.container_tool, "wait", "--condition=running", self.container_id]
+            try:
+                self._run_command(wait_cmd, capture=False, timeout=timeout)
+                return True
+            except subprocess.TimeoutExpired:
+                return False
+            except subprocess.CalledProcessError:
+                logger.warning("'podman wait --condition=running' failed; polling container state instead.")
+
+        inspect_cmd = [self.container_tool, "inspect", "-f", "{{.State.Running}}", self.container_id]
+        delay = _POLL_INITIAL_DELAY
+        while True:
             try:
-                inspect_cmd = [self.container_tool, "inspect", "-f", "{{.State.Running}}", self.container_id]
                 result = self._run_command(inspect_cmd, check=False)
                 if result.returncode == 0 and result.stdout.strip() == "true":
-                    logger.info(f"Container {self.container_id} is now running.")
-                    return
+                    return True
             except subprocess.CalledProcessError as e:
                 logger.warning(
                     f"Error inspecting container {self.container_id} while waiting for start: {e.stderr}"
                 )
-            time.sleep(1)
-        raise RuntimeError(f"Container {self.container_id} did not reach running state within {timeout} seconds.")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, _POLL_MAX_DELAY)
+
+    def _open_shell(self):
+        """Start a persistent shell session used to run commands in the container.
+
+        Falls back to one ``exec`` per command if the session cannot be started.
+        """
+        argv = [self.container_tool, "exec", "-i", self.container_id, "bash"]
+        logger.debug(f"Opening shell session: {' '.join(argv)}")
+        shell = None
+        try:
+            shell = _ShellSession(argv)
+            shell.run("true")
+        except (OSError, RuntimeError) as e:
+            logger.warning(
+                f"Could not open a shell session in container {self.container_id}; "
+                f"falling back to one exec per command: {e}"
+            )
+            if shell is not None:
+                shell.close()
+            return
+        with self._shell_lock:
+            self._shell_argv = argv
+            self._shells.append(shell)
+            self._idle_shells.append(shell)
+
+    def _close_shell(self):
+        with self._shell_lock:
+            shells = self._shells
+            self._shells = []
+            self._idle_shells = []
+            self._shell_argv = None
+        for shell in shells:
+            shell.close()
+
+    def _acquire_shell(self):
+        """Return an idle shell session, opening another one if all are busy.
+
+        Returns None if commands have to fall back to one ``exec`` each.
+        """
+        with self._shell_lock:
+            if self._idle_shells:
+                return self._idle_shells.pop()
+            argv = self._shell_argv
+        if argv is None:
+            return None
+        try:
+            shell = _ShellSession(argv)
+        except OSError as e:
+            logger.warning(f"Could not open an additional shell session: {e}")
+            return None
+        with self._shell_lock:
+            closed = self._shell_argv is None
+            if not closed:
+                self._shells.append(shell)
+        if closed:
+            shell.close()
+            return None
+        return shell
+
+    def _release_shell(self, shell: _ShellSession):
+        with self._shell_lock:
+            if shell in self._shells:
+                self._idle_shells.append(shell)
+
+    def _discard_shell(self, shell: _ShellSession):
+        with self._shell_lock:
+            if shell in self._shells:
+                self._shells.remove(shell)
+        shell.close()
+
+    def _exec(self, command: str) -> Tuple[int, str, str]:
+        """Run ``command`` with ``bash -c`` inside the container."""
+        returncode, stdout, stderr = self._exec_bytes(command)
+        return returncode, _decode_output(stdout), _decode_output(stderr)
+
+    def _exec_bytes(self, command: str) -> Tuple[int, bytes, bytes]:
+        """Like :meth:`_exec`, but return stdout and stderr undecoded."""
+        shell = self._acquire_shell()
+        if shell is not None:
+            logger.debug(f"Executing in shell session: {command}")
+            try:
+                returncode, stdout, stderr = shell.run(command)
+            except BaseException:
+                # The session may have died or still hold unread output.
+                self._discard_shell(shell)
+                raise
+            self._release_shell(shell)
+            return returncode, stdout, stderr
+        cmd = [self.container_tool, "exec", self.container_id, "bash", "-c", command]
+        result = self._run_command(cmd, shell=False, check=False, text=False)
+        return result.returncode, result.stdout, result.stderr
 
     def stop(self, timeout: int = 10):
         """Stop the container."""
         if not self.container_id:
             logger.warning("No container ID set to stop.")
             return
+        self._close_shell()
+        self._running = False
         logger.info(f"Stopping container {self.container_id} (timeout: {timeout}s)...")
         stop_flag = "--time" if self.container_tool == "podman" else "-t"
         try:
-            self._run_command([self.container_tool, "stop", stop_flag, str(timeout), self.container_id], check=False)
+            self._run_command(
+                [self.container_tool, "stop", stop_flag, str(timeout), self.container_id],
+                check=False,
+                capture=False,
+            )
             logger.info(f"Container {self.container_id} stop command issued.")
         except subprocess.CalledProcessError as e:
             logger.error(f"Error stopping container {self.container_id}: {e.stderr}")
@@ -99,7 +409,7 @@ class ContainerManager:
             cmd.append("-f")
         cmd.append(self.container_id)
         try:
-            self._run_command(cmd, check=False)
+            self._run_command(cmd, check=False, capture=False)
             logger.info(f"Container {self.container_id} removed.")
         except subprocess.CalledProcessError as e:
             logger.error(f"Error removing container {self.container_id}: {e.stderr}")
@@ -115,34 +425,105 @@ class ContainerManager:
 
         dest_path_str = f"{self.container_id}:{dest_in_container}"
         logger.info(f"Copying '{src_path}' to '{dest_path_str}'...")
-        self._run_command([self.container_tool, "cp", str(src_path), dest_path_str])
+        self._run_command([self.container_tool, "cp", str(src_path), dest_path_str], capture=False)
         logger.info(f"Successfully copied '{src_path}' to '{dest_path_str}'.")
 
+    def copy_many_to(self, entries: List[Tuple[Path, str]]):
+        """Copy several host paths into the container at once.
+
+        All sources are packed into a single tar stream extracted by one
+        ``<tool> cp -`` call instead of running ``<tool> cp`` per entry. The
+        placement rules of ``cp`` are kept: a source copied to an existing
+        directory ends up inside it, otherwise it is stored under the
+        destination path itself. Copied files are owned by root, as with
+        ``cp``.
+
+        Destinations are inspected before anything is copied, so entries are
+        copied one by one when an earlier copy could change where a later one
+        lands: when one destination equals or contains another, or when a
+        destination ends with a slash. Inspecting them needs a running
+        container, so a container that is only created gets one ``cp`` per
+        entry as well.
+        """
+        dests = [posixpath.normpath(posixpath.join("/", dest)) for _, dest in entries]
+        if (
+            len(entries) <= 1
+            or not self._running
+            or not _independent_destinations([dest for _, dest in entries], dests)
+        ):
+            for src_path, dest in entries:
+                self.copy_to(src_path, dest)
+            return
+        if not self.container_id:
+            raise RuntimeError("Container not available for copy operation.")
+        for src_path, _ in entries:
+            if not src_path.exists():
+                raise FileNotFoundError(f"Source path for copy does not exist: {src_path}")
+
+        is_dir = self._dirs_in_container(dests)
+
+        def as_root(info: tarfile.TarInfo) -> tarfile.TarInfo:
+            info.uid = info.gid = 0
+            info.uname = info.gname = "root"
+            return info
+
+        cmd = [self.container_tool, "cp", "-", f"{self.container_id}:/"]
+        logger.info(f"Copying {len(entries)} paths to container {self.container_id} in one tar stream...")
+        logger.debug(f"Executing command: {' '.join(cmd)}")
+        with tempfile.TemporaryFile() as err, subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=err
+        ) as proc:
+            _grow_pipe(proc.stdin)
+            try:
+                with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                    for (src_path, _), dest, dest_is_dir in zip(entries, dests, is_dir):
+                        target = posixpath.join(dest, src_path.name) if dest_is_dir else dest
+                        logger.info(f"Copying '{src_path}' to '{self.container_id}:{target}'...")
+                        tar.add(str(src_path), arcname=target.lstrip("/"), filter=as_root)
+            finally:
+                proc.stdin.close()
+            returncode = proc.wait()
+            if returncode != 0:
+                err.seek(0)
+                stderr_text = err.read().decode("utf-8", errors="replace").strip()
+                logger.error(f"Command failed with exit code {returncode}: {' '.join(cmd)}")
+                if stderr_text:
+                    logger.error(f"Failed command stderr: {stderr_text}")
+                raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_text)
+        logger.info(f"Successfully copied {len(entries)} paths to container {self.container_id}.")
+
+    def _dirs_in_container(self, paths: List[str]) -> List[bool]:
+        """Return whether each absolute path in ``paths`` is a directory in the container."""
+        check = "; ".join(f"if [ -d {shlex.quote(p)} ]; then echo d; else echo -; fi" for p in paths)
+        returncode, stdout, stderr = self._exec(check)
+        kinds = stdout.split()
+        if returncode != 0 or len(kinds) != len(paths):
+            raise RuntimeError(f"Could not inspect copy destinations in container: {stderr.strip()}")
+        return [kind == "d" for kind in kinds]
+
     def execute_command(self, command: str) -> dict:
         """Execute a command inside the running container."""
         if not self.container_id:
             raise RuntimeError("Container not available for command execution.")
 
-        cmd = [self.container_tool, "exec", self.container_id, "bash", "-c", command]
-        full_cmd_str = " ".join(cmd)
-        logger.info(f"Executing in container {self.container_id}: {full_cmd_str}")
+        logger.info(f"Executing in container {self.container_id}: {command}")
 
-        result = self._run_command(cmd, shell=False, check=False)
+        returncode, stdout, stderr = self._exec(command)
 
-        if result.returncode == 0:
+        if returncode == 0:
             logger.info(f"Successfully executed in container: {command}")
         else:
-            logger.warning(f"Command in container exited with code {result.returncode}: {command}")
-            if result.stdout.strip():
-                logger.warning(f"  Stdout: {result.stdout.strip()}")
-            if result.stderr.strip():
-                logger.warning(f"  Stderr: {result.stderr.strip()}")
+            logger.warning(f"Command in container exited with code {returncode}: {command}")
+            if stdout.strip():
+                logger.warning(f"  Stdout: {stdout.strip()}")
+            if stderr.strip():
+                logger.warning(f"  Stderr: {stderr.strip()}")
 
         return {
             "command": command,
-            "stdout": result.stdout.strip(),
-            "stderr": result.stderr.strip(),
-            "return_code": result.returncode,
+            "stdout": stdout.strip(),
+            "stderr": stderr.strip(),
+            "return_code": returncode,
         }
 
     def export_paths(self, target_paths_in_container: List[str], host_output_dir: Path):
@@ -158,28 +539,61 @@ class ContainerManager:
         target_paths_str = " ".join(cleaned_target_paths)
 
         logger.info(f"Exporting '{target_paths_str}' from {self.container_id} to '{host_output_dir}'...")
-        cmd_str = f"{self.container_tool} export {self.container_id} | tar -x -C \"{str(host_output_dir)}\" {target_paths_str}"
-        self._run_command(cmd_str, shell=True)
-        self._run_command(f"chmod -R u+rwx \"{str(host_output_dir)}\"", shell=True)
+        export_cmd = [self.container_tool, "export", self.container_id]
+        tar_cmd = ["tar", "-x", "--no-same-owner", "-C", str(host_output_dir), *cleaned_target_paths]
+        logger.debug(f"Executing command: {' '.join(export_cmd)} | {' '.join(tar_cmd)}")
+        with tempfile.TemporaryFile() as export_err:
+            export_proc = subprocess.Popen(export_cmd, stdout=subprocess.PIPE, stderr=export_err)
+            _grow_pipe(export_proc.stdout)
+            try:
+                tar_result = subprocess.run(
+                    tar_cmd, stdin=export_proc.stdout, check=False, capture_output=True, text=True
+                )
+            finally:
+                # Let the export fail with SIGPIPE instead of blocking if tar exited early.
+                export_proc.stdout.close()
+                export_returncode = export_proc.wait()
+            if tar_result.returncode != 0:
+                logger.error(f"Command failed with exit code {tar_result.returncode}: {' '.join(tar_cmd)}")
+                if tar_result.stderr:
+                    logger.error(f"Failed command stderr: {tar_result.stderr.strip()}")
+                raise subprocess.CalledProcessError(
+                    tar_result.returncode, tar_cmd, tar_result.stdout, tar_result.stderr
+                )
+            if export_returncode != 0:
+                export_err.seek(0)
+                export_stderr = export_err.read().decode("utf-8", errors="replace").strip()
+                logger.error(f"Command failed with exit code {export_returncode}: {' '.join(export_cmd)}")
+                if export_stderr:
+                    logger.error(f"Failed command stderr: {export_stderr}")
+                raise subprocess.CalledProcessError(export_returncode, export_cmd, stderr=export_stderr)
+        # Extracted files keep the modes they had in the container, which may
+        # leave them unreadable for diff or undeletable afterwards. Root is not
+        # restricted by file modes, so the extra pass over the tree is skipped.
+        # Platforms without geteuid() (Windows) always get the pass.
+        if not hasattr(os, "geteuid") or os.geteuid() != 0:
+            self._run_command(["chmod", "-R", "u+rwx", str(host_output_dir)], capture=False)
         logger.info(f"Successfully exported paths to '{host_output_dir}'.")
 
     def capture_command_output(self, command: str, host_outfile: Path):
-        """Execute a command in the container and save its stdout to a host file."""
+        """Execute a command in the container and save its stdout to a host file.
+
+        The parent directory of ``host_outfile`` must already exist.
+        """
         if not self.container_id:
             raise RuntimeError("Container not available for capturing command output.")
 
         logger.info(f"Capturing output of '{command}' from {self.container_id} to '{host_outfile}'...")
-        escaped_command = command.replace('"', r'\"')
-        full_cmd_str = f"{self.container_tool} exec {self.container_id} bash -c \"{escaped_command}\""
-        result = self._run_command(full_cmd_str, shell=True, check=False)
+        returncode, stdout, stderr = self._exec_bytes(command)
 
-        host_outfile.parent.mkdir(parents=True, exist_ok=True)
-        with open(host_outfile, "w", encoding="utf-8") as f:
-            f.write(result.stdout)
+        # Written as bytes: large outputs are not turned into a str and back.
+        with open(host_outfile, "wb") as f:
+            f.write(_encode_output(stdout))
         logger.info(f"Output of '{command}' saved to '{host_outfile}'.")
-        if result.returncode != 0:
+        if returncode != 0:
             logger.warning(
-                f"Command '{command}' in container exited with code {result.returncode}. Stderr: {result.stderr.strip()}"
+                f"Command '{command}' in container exited with code {returncode}. "
+                f"Stderr: {_decode_output(stderr).strip()}"
             )
 
     def __enter__(self):
@@ -187,7 +601,28 @@ class ContainerManager:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._cleanup_thread is not None:
+            self._cleanup_thread.join()
+            return
+        self._cleanup()
+
+    def cleanup_in_background(self) -> None:
+        """Start stopping and removing the container in a background thread.
+
+        Callers that no longer need the container can go on with other work;
+        leaving the ``with`` block waits for the cleanup to finish.
+        """
+        if self._cleanup_thread is None:
+            self._cleanup_thread = threading.Thread(target=self._cleanup, name="envdiff-cleanup")
+            self._cleanup_thread.start()
+
+    def _cleanup(self) -> None:
+        """Close the shell sessions, then stop and remove the container."""
         logger.info(f"Cleaning up container {self.container_id}...")
+        try:
+            self._close_shell()
+        except Exception as e:
+            logger.error(f"Exception while closing shell session in __exit__: {e}", exc_info=False)
         try:
             if self.container_id:
                 self.stop(timeout=0)
@@ -1,10 +1,49 @@
-import subprocess
+import functools
 import logging
+import os
+import re
+import stat
+import string
+import subprocess
+import tempfile
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Pattern, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Header lines of diff output ("diff ...", "Only in ...", "Binary files ...")
+# are the only ones starting with a letter.
+_HEADER_START = frozenset(string.ascii_letters)
+# Unified diff file header lines, which carry a tab-separated timestamp.
+_TIMESTAMP_LINE_START = ("--- ", "+++ ")
+
+# Regexes for the start of header lines up to the path matched against
+# ``exclude_paths`` ("Files ..."/"Only in ..." for -rq, "diff -urN ..." for -urN).
+_RQ_HEADER = r"[^ ]* ([^ ]* )?[^ /]*"
+_URN_HEADER = r"[^ ]* [^ ]* [^ /]*"
+
+# POSIX character classes, which exclude_paths could use while they were
+# matched by grep -E, mapped to the equivalent ranges in Python regexes.
+_POSIX_CLASSES = {
+    "alnum": "a-zA-Z0-9",
+    "alpha": "a-zA-Z",
+    "blank": r" \t",
+    "cntrl": r"\x00-\x1f\x7f",
+    "digit": "0-9",
+    "graph": r"\x21-\x7e",
+    "lower": "a-z",
+    "print": r"\x20-\x7e",
+    "punct": re.escape(string.punctuation),
+    "space": r" \t\n\r\f\v",
+    "upper": "A-Z",
+    "xdigit": "0-9A-Fa-f",
+}
+_POSIX_CLASS = re.compile(r"\[:(" + "|".join(_POSIX_CLASSES) + r"):\]")
+
+# Relative paths that ``diff`` prints as they are. Names containing spaces,
+# quotes, backslashes, control or non-ASCII characters are quoted.
+_UNQUOTED_PATH = re.compile(r"[!#-\[\]-~]+\Z")
+
 
 def generate_diff_report(
     base_path: Path,
@@ -14,85 +53,268 @@ def generate_diff_report(
     omit_diff_paths: Optional[List[str]] = None,
 ) -> str:
     """Generate a diff report between two directories or files."""
+    lines = list(iter_diff_report(base_path, after_path, diff_type, exclude_paths, omit_diff_paths))
+    if not lines:
+        return ""
+    lines.append("")
+    return "\n".join(lines)
+
+
+def iter_diff_report(
+    base_path: Path,
+    after_path: Path,
+    diff_type: str,
+    exclude_paths: Optional[List[str]] = None,
+    omit_diff_paths: Optional[List[str]] = None,
+) -> Iterator[str]:
+    """Yield the lines of the diff report produced by :func:`generate_diff_report`.
+
+    Lines are yielded without their trailing newline while ``diff`` is still
+    running, so callers can process large reports without holding them in
+    memory as a single string.
+    """
     if exclude_paths is None:
         exclude_paths = []
     if omit_diff_paths is None:
         omit_diff_paths = []
 
-    exclude_args_str = "|".join(exclude_paths) if exclude_paths else "EMPTY_EXCLUDE_LIST_PLACEHOLDER"
-
-    cmd_str = None
-    base_name = base_path.name
-    after_name = after_path.name
-
     if diff_type == "rq":
-        diff_command_part = f"LANG=C diff -rq \"{base_name}\" \"{after_name}\""
-        if exclude_paths:
-            diff_command_part += f" | grep -Ev '^[^ ]* ([^ ]* )?[^ /]*({exclude_args_str})'"
-        cmd_str = f"cd \"{base_path.parent}\" && {diff_command_part}"
-
+        cwd = base_path.parent
+        diff_args = ["-rq", base_path.name, after_path.name]
     elif diff_type == "urN":
-        awk_script = (
-            "'/^[a-zA-Z]/{if(n){if(h!~p){for(i=0;i<c;i++)print a[i];}delete a};c=0;h=$0;n=1}n{"
-            "a[c++]=$0}END{if(n&&h!~p){for(i=0;i<c;i++)print a[i]}}'"
-        )
-        sed_script = r"'/^\(---\|+++\) /s/\t.*//'"
-        diff_command_part = f"LANG=C diff -urN \"{base_name}\" \"{after_name}\""
-        if exclude_paths:
-            diff_command_part += f" | awk -v p='^[^ ]* [^ ]* [^ /]*({exclude_args_str})' {awk_script}"
-        else:
-            simplified_awk = (
-                "'/^[a-zA-Z]/{if(n){for(i=0;i<c;i++)print a[i];delete a};c=0;h=$0;n=1}n{a[c++]=$0}END{if(n){for(i=0;i<c;i++)print a[i]}}'"
-            )
-            diff_command_part += f" | awk {simplified_awk}"
-        diff_command_part += f" | sed -e {sed_script}"
-        cmd_str = f"cd \"{base_path.parent}\" && {diff_command_part}"
-
+        cwd = base_path.parent
+        diff_args = ["-urN", base_path.name, after_path.name]
     elif diff_type == "text":
-        base_relative_path = f"{base_path.parent.name}/{base_path.name}"
-        after_relative_path = f"{after_path.parent.name}/{after_path.name}"
-        sed_script = r"'/^\(---\|+++\) /s/\t.*//'"
-        cmd_str = (
-            f"cd \"{base_path.parent.parent}\" && LANG=C diff -su \"{base_relative_path}\" \"{after_relative_path}\" | sed -e {sed_script}"
-        )
+        cwd = base_path.parent.parent
+        diff_args = [
+            "-su",
+            f"{base_path.parent.name}/{base_path.name}",
+            f"{after_path.parent.name}/{after_path.name}",
+        ]
     else:
         logger.error(f"Unsupported diff type: {diff_type}")
-        return ""
+        return
 
     logger.info(f"Generating {diff_type} diff...")
-    logger.debug(f"Diff command: {cmd_str}")
+    cmd = ["diff", *diff_args]
+    logger.debug(f"Diff command: {' '.join(cmd)} (in {cwd})")
+
+    lines = _run_diff(cmd, cwd)
+    if diff_type == "rq":
+        if exclude_paths:
+            exclude_re = _exclude_pattern(_RQ_HEADER, tuple(exclude_paths))
+            lines = (line for line in lines if not exclude_re.match(line))
+    elif diff_type == "urN":
+        exclude_re = _exclude_pattern(_URN_HEADER, tuple(exclude_paths)) if exclude_paths else None
+        omit_re = _omit_pattern(tuple(omit_diff_paths)) if omit_diff_paths else None
+        lines = _filter_urn(lines, exclude_re, omit_re)
+    else:
+        lines = map(_strip_timestamp, lines)
 
-    result = subprocess.run(cmd_str, shell=True, check=False, capture_output=True, text=True, encoding="utf-8")
+    yield from lines
+    logger.info(f"Diff content for type '{diff_type}' generated.")
+
+
+def group_diff_sections(lines: Iterable[str]) -> List[str]:
+    """Group diff output lines into one string per header line.
+
+    A section starts at every line beginning with an ASCII letter (``diff``,
+    ``Only in``, ``Binary files`` ...) and runs up to the next one. Sections
+    do not keep their trailing newline.
+    """
+    sections = []
+    current: List[str] = []
+    for line in lines:
+        if current and len(line) > 1 and line[0] in _HEADER_START:
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+
+def prune_excluded_files(base_path: Path, after_path: Path, exclude_paths: List[str]) -> int:
+    """Delete regular files from both trees whose diff output is excluded anyway.
+
+    ``diff`` reads every file it compares, even when everything it prints
+    about them is dropped by ``exclude_paths`` afterwards. A file is removed
+    only when every line ``diff -rq`` and ``diff -urN`` could print about it
+    is excluded, its name is printed unquoted, the other tree has a regular
+    file or nothing at that path, and no symlink in either tree resolves to
+    it or one of its parent directories. Reports are therefore unchanged.
+    Returns the number of files removed.
+    """
+    if not exclude_paths:
+        return 0
+    rq_re = _exclude_pattern(_RQ_HEADER, tuple(exclude_paths))
+    urn_re = _exclude_pattern(_URN_HEADER, tuple(exclude_paths))
+    base_name, after_name = base_path.name, after_path.name
 
-    if result.returncode > 1:
-        logger.error(
-            f"Diff command failed or encountered an issue. Exit code: {result.returncode}. Stderr: {result.stderr.strip()}"
+    def is_excluded(rel: str) -> bool:
+        parent, _, name = rel.rpartition("/")
+        where = f"/{parent}" if parent else ""
+        return bool(
+            urn_re.match(f"diff -urN {base_name}/{rel} {after_name}/{rel}")
+            and urn_re.match(f"Binary files {base_name}/{rel} and {after_name}/{rel} differ")
+            and rq_re.match(f"Files {base_name}/{rel} and {after_name}/{rel} differ")
+            and rq_re.match(f"Only in {base_name}{where}: {name}")
+            and rq_re.match(f"Only in {after_name}{where}: {name}")
         )
-    output = result.stdout
-    if diff_type == "urN" and omit_diff_paths:
-        output = _omit_diff_details(output, omit_diff_paths)
 
-    logger.info(f"Diff content for type '{diff_type}' generated.")
-    return output
+    roots = (base_path, after_path)
+    real_roots = [os.path.realpath(root) for root in roots]
+    files: List[set] = [set(), set()]
+    link_targets: List[set] = [set(), set()]
+    for side, root in enumerate(roots):
+        for rel, is_link in _walk_tree(root):
+            if is_link:
+                target = os.path.realpath(os.path.join(root, rel))
+                for i, real_root in enumerate(real_roots):
+                    common = os.path.commonpath([real_root, target])
+                    if common == target:
+                        link_targets[i].add("")
+                    elif common == real_root:
+                        link_targets[i].add(os.path.relpath(target, real_root))
+            elif _UNQUOTED_PATH.match(rel) and is_excluded(rel):
+                files[side].add(rel)
+
+    pruned = 0
+    for rel in files[0] | files[1]:
+        sides = [i for i in (0, 1) if rel in files[i]]
+        if any(_is_link_target(rel, link_targets[i]) for i in sides):
+            continue
+        if not all(_is_file_or_missing(roots[i] / rel) for i in (0, 1) if i not in sides):
+            continue
+        for i in sides:
+            os.unlink(roots[i] / rel)
+        pruned += 1
+    logger.debug(f"Removed {pruned} excluded files before running diff.")
+    return pruned
+
+
+def _walk_tree(root: Path) -> Iterator[Tuple[str, bool]]:
+    """Yield ``(relative path, is symlink)`` for regular files and symlinks under ``root``."""
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.is_symlink():
+                    yield rel, True
+                elif entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                elif entry.is_file(follow_symlinks=False):
+                    yield rel, False
+
+
+def _is_link_target(rel: str, targets: set) -> bool:
+    """Return whether ``rel`` or one of its parent directories is in ``targets``."""
+    if not targets:
+        return False
+    if "" in targets or rel in targets:
+        return True
+    return any(rel[:i] in targets for i, c in enumerate(rel) if c == "/")
+
 
+def _is_file_or_missing(path: Path) -> bool:
+    """Return whether ``diff`` sees a regular file or nothing at all at ``path``."""
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except (FileNotFoundError, NotADirectoryError):
+        return not os.path.lexists(path)
 
-def _omit_diff_details(diff_text: str, paths: List[str]) -> str:
-    """Remove diff hunks for specific paths and mark the omission."""
-    keep_newline = diff_text.endswith("\n")
-    lines = diff_text.splitlines()
-    filtered_lines: List[str] = []
-    skip = False
+
+def validate_exclude_paths(exclude_paths: List[str]) -> None:
+    """Raise ``ValueError`` naming the first entry that is not a valid regex."""
+    if exclude_paths:
+        _exclude_pattern(_URN_HEADER, tuple(exclude_paths))
+
+
+@functools.lru_cache(maxsize=32)
+def _exclude_pattern(header: str, exclude_paths: Tuple[str, ...]) -> Pattern[str]:
+    """Compile the regex matching header lines of excluded paths.
+
+    ``exclude_paths`` are Python regexes; POSIX classes such as ``[:digit:]``
+    are translated so that patterns written for ``grep -E`` keep working.
+    """
+    patterns = [_POSIX_CLASS.sub(lambda m: _POSIX_CLASSES[m.group(1)], p) for p in exclude_paths]
+    try:
+        return re.compile(rf"{header}({'|'.join(patterns)})")
+    except re.error as e:
+        for original, pattern in zip(exclude_paths, patterns):
+            try:
+                re.compile(pattern)
+            except re.error as entry_error:
+                raise ValueError(f"Invalid regular expression in exclude_paths: {original!r} ({entry_error})") from None
+        raise ValueError(f"Invalid regular expressions in exclude_paths: {e}") from None
+
+
+@functools.lru_cache(maxsize=32)
+def _omit_pattern(omit_paths: Tuple[str, ...]) -> Pattern[str]:
+    """Compile the regex finding any of ``omit_paths`` as a plain substring."""
+    return re.compile("|".join(map(re.escape, omit_paths)))
+
+
+def _run_diff(cmd: List[str], cwd: Path) -> Iterator[str]:
+    """Run ``diff`` and yield its output lines without trailing newlines.
+
+    Output is consumed while ``diff`` is still running instead of being
+    buffered as a whole. Stderr goes to a temporary file so that it cannot
+    fill up a pipe and stall the process.
+    """
+    with tempfile.TemporaryFile() as stderr, subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env={**os.environ, "LANG": "C"},
+        stdout=subprocess.PIPE,
+        stderr=stderr,
+        text=True,
+        encoding="utf-8",
+    ) as proc:
+        for line in proc.stdout:
+            yield line[:-1] if line.endswith("\n") else line
+        returncode = proc.wait()
+        if returncode > 1:
+            stderr.seek(0)
+            stderr_text = stderr.read().decode("utf-8", errors="replace")
+            logger.error(
+                f"Diff command failed or encountered an issue. Exit code: {returncode}. Stderr: {stderr_text.strip()}"
+            )
+
+
+def _filter_urn(
+    lines: Iterable[str], exclude_re: Optional[Pattern[str]], omit_re: Optional[Pattern[str]]
+) -> Iterator[str]:
+    """Post-process ``diff -urN`` output in a single pass.
+
+    A section starts at a line beginning with an ASCII letter. Lines before the
+    first header and sections matching ``exclude_re`` are dropped, timestamps
+    are removed from ``---``/``+++`` lines, and the hunks of sections whose
+    header matches ``omit_re`` anywhere are replaced by an ``(omitted)`` marker.
+    """
+    keep = False
+    omit = False
     for line in lines:
-        if line and line[0].isalpha():
-            skip = any(p in line for p in paths)
-            if skip and line.startswith("diff "):
-                filtered_lines.append(f"{line} (omitted)")
+        if line[:1] in _HEADER_START:
+            keep = exclude_re is None or not exclude_re.match(line)
+            if not keep:
+                continue
+            omit = omit_re is not None and omit_re.search(line) is not None
+            if omit and line.startswith("diff "):
+                yield f"{line} (omitted)"
             else:
-                filtered_lines.append(line)
-        else:
-            if not skip:
-                filtered_lines.append(line)
-    result = "\n".join(filtered_lines)
-    if keep_newline and result:
-        result += "\n"
-    return result
+                yield line
+        elif keep and not omit:
+            # Inlined _strip_timestamp(): this runs for every line of the diff.
+            if line.startswith(_TIMESTAMP_LINE_START):
+                line = line.partition("\t")[0]
+            yield line
+
+
+def _strip_timestamp(line: str) -> str:
+    """Remove the timestamp from ``---``/``+++`` file header lines."""
+    if line.startswith(_TIMESTAMP_LINE_START):
+        return line.partition("\t")[0]
+    return line
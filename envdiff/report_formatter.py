@@ -1,43 +1,179 @@
+import io
 import json
+import re
+from collections import OrderedDict
 from pathlib import Path
+from typing import Callable, Optional
 
+try:
+    import orjson
+except ImportError:  # optional, only speeds up reading and formatting the report
+    orjson = None
 
-def _indent_block(text: str, indent: int = 2) -> str:
-    """Return the given multiline text indented by the specified spaces."""
-    prefix = " " * indent
-    return "\n".join(prefix + line for line in text.splitlines())
+# orjson silently turns integers outside the 64-bit range into floats; any
+# number that long (19+ digits) is left to json. Long digit runs inside strings
+# only cost the fast path.
+_LONG_DIGITS = re.compile(rb"\d{19}")
+# Line boundaries recognized by str.splitlines() besides "\n".
+_OTHER_LINE_BREAKS = re.compile("[\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+_PREFIXES = {i: " " * i for i in (2, 4, 6, 8)}
+# Definitions listed first, in this order; any others follow as in the report.
+_DEFINITION_ORDER = ("base_image", "prepare", "target_dirs", "exclude_paths", "omit_diff_paths")
+_DEFINITION_KEYS = frozenset(_DEFINITION_ORDER)
+_CACHE_SIZE = 32
+# Formatted reports keyed by (path, mtime_ns, size, max_lines).
+_cache: "OrderedDict[tuple, str]" = OrderedDict()
 
 
-def json_report_to_text(report_path: Path) -> str:
-    """Convert an envdiff JSON report to a human readable string."""
-    with open(report_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def _write_indented(w: Callable[[str], object], text: str, indent: int = 2) -> None:
+    """Write the given multiline text indented by the specified spaces.
 
-    lines = []
+    Each line, including the last one, is terminated by a newline; empty text
+    is written as a single empty line.
+    """
+    if not text:
+        w("\n")
+        return
+    prefix = _PREFIXES.get(indent) or " " * indent
+    if _OTHER_LINE_BREAKS.search(text):
+        for line in text.splitlines():
+            w(prefix)
+            w(line)
+            w("\n")
+        return
+    if text.endswith("\n"):
+        text = text[:-1]
+    w(prefix)
+    w(text.replace("\n", "\n" + prefix))
+    w("\n")
+
+
+def json_report_to_text(report_path: Path, max_lines: Optional[int] = None) -> str:
+    """Convert an envdiff JSON report to a human readable string.
+
+    If ``max_lines`` is given, formatting stops after that many lines and a
+    ``... (truncated)`` marker is appended.
+
+    Results are cached per file and reused as long as the report's
+    modification time and size are unchanged.
+    """
+    st = Path(report_path).stat()
+    key = (str(report_path), st.st_mtime_ns, st.st_size, max_lines)
+    text = _cache.get(key)
+    if text is not None:
+        _cache.move_to_end(key)
+        return text
+
+    text = _format_report(_load_report(Path(report_path).read_bytes()), max_lines)
+
+    _cache[key] = text
+    if len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last=False)
+    return text
+
+
+class _Truncated(Exception):
+    """Raised by :class:`_LineLimitedWriter` once its line limit is reached."""
+
+
+class _LineLimitedWriter:
+    """Forward writes until ``max_lines`` complete lines have been written.
+
+    Whitespace written after that is dropped, as it would be stripped from the
+    end of the report anyway; any other text raises :class:`_Truncated`.
+    """
+
+    def __init__(self, write: Callable[[str], object], max_lines: int):
+        self._write = write
+        self._remaining = max_lines
+
+    def __call__(self, text: str) -> None:
+        if not self._remaining:
+            if text and not text.isspace():
+                raise _Truncated
+            return
+        newlines = text.count("\n")
+        if newlines < self._remaining or (newlines == self._remaining and text.endswith("\n")):
+            self._remaining -= newlines
+            self._write(text)
+            return
+        end = 0
+        for _ in range(self._remaining):
+            end = text.index("\n", end) + 1
+        self._write(text[:end])
+        self._remaining = 0
+        self(text[end:])
+
+
+def _load_report(raw: bytes) -> dict:
+    """Parse the UTF-8 encoded JSON report ``raw``."""
+    if orjson is not None and not _LONG_DIGITS.search(raw):
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson rejects some input json accepts (NaN, Infinity);
+            # let json decide and report real errors.
+            pass
+    return json.loads(raw.decode("utf-8"))
+
+
+def _orjson_compatible(value) -> bool:
+    """Return whether orjson serializes ``value`` exactly like json.
+
+    Floats are formatted differently (``1e16`` vs ``1e+16``, ``null`` vs
+    ``NaN``) and integers outside the 64-bit range are rejected.
+    """
+    if isinstance(value, dict):
+        return all(_orjson_compatible(v) for v in value.values())
+    if isinstance(value, list):
+        return all(_orjson_compatible(v) for v in value)
+    if isinstance(value, float):
+        return False
+    if isinstance(value, int):
+        return -(2**63) <= value < 2**64
+    return True
+
+
+def _pretty_json(value) -> str:
+    """Return ``value`` as JSON indented by two spaces."""
+    if orjson is not None and _orjson_compatible(value):
+        try:
+            return orjson.dumps(value, option=orjson.OPT_INDENT_2).decode("utf-8")
+        except (TypeError, orjson.JSONEncodeError):  # lone surrogates
+            pass
+    return json.dumps(value, indent=2, ensure_ascii=False)
+
+
+def _format_report(data: dict, max_lines: Optional[int] = None) -> str:
+    """Format a loaded envdiff report, stopping after ``max_lines`` lines."""
+    out = io.StringIO()
+    w = out.write if max_lines is None else _LineLimitedWriter(out.write, max_lines)
+    try:
+        _write_report(w, data)
+    except _Truncated:
+        return out.getvalue().rstrip() + "\n... (truncated)\n"
+    return out.getvalue().rstrip() + "\n"
+
+
+def _write_report(w: Callable[[str], object], data: dict) -> None:
+    """Write the text form of ``data`` through ``w``."""
     meta = data.get("report_metadata", {})
-    lines.append(f"Report generated on: {meta.get('generated_on', 'unknown')}")
-    lines.append(f"Container tool: {meta.get('container_tool', 'unknown')}")
+    w(f"Report generated on: {meta.get('generated_on', 'unknown')}\n")
+    w(f"Container tool: {meta.get('container_tool', 'unknown')}\n")
     title = meta.get("title")
     if title:
-        lines.append(f"Title: {title}")
+        w(f"Title: {title}\n")
     desc = meta.get("description")
     if desc:
-        lines.append("Description:")
-        lines.append(_indent_block(str(desc), 2))
-    lines.append("")
+        w("Description:\n")
+        _write_indented(w, str(desc), 2)
+    w("\n")
 
     definitions = data.get("definitions", {})
     if definitions:
-        lines.append("Definitions:")
-        ordered_keys = [
-            "base_image",
-            "prepare",
-            "target_dirs",
-            "exclude_paths",
-            "omit_diff_paths",
-        ]
-        keys = [k for k in ordered_keys if k in definitions]
-        keys.extend(k for k in definitions if k not in keys)
+        w("Definitions:\n")
+        keys = [k for k in _DEFINITION_ORDER if k in definitions]
+        keys.extend(k for k in definitions if k not in _DEFINITION_KEYS)
         for key in keys:
             value = definitions[key]
             if key == "command_diff":
@@ -47,79 +183,92 @@ def json_report_to_text(report_path: Path) -> str:
                 if not value:
                     continue
 
-            lines.append(f"- {key}:")
+            w(f"- {key}:\n")
 
             if key == "prepare" and isinstance(value, dict):
                 copy_files = value.get("copy_files", [])
                 if copy_files:
-                    lines.append("  copy_files:")
+                    w("  copy_files:\n")
                     for item in copy_files:
                         if isinstance(item, dict):
                             src = item.get("src", "")
                             dest = item.get("dest", "")
-                            lines.append(f"    - {src} -> {dest}")
+                            w(f"    - {src} -> {dest}\n")
                         else:
-                            lines.append(f"    - {item}")
+                            w(f"    - {item}\n")
                 commands = value.get("commands", [])
                 if commands:
-                    lines.append("  commands:")
+                    w("  commands:\n")
                     for cmd in commands:
-                        lines.append(f"    - {cmd}")
+                        w(f"    - {cmd}\n")
                 extra_keys = [k for k in value if k not in {"copy_files", "commands"}]
                 for k in extra_keys:
                     val = value[k]
                     if isinstance(val, (dict, list)):
-                        val_str = json.dumps(val, indent=2, ensure_ascii=False)
-                        lines.append(_indent_block(val_str, 2))
+                        val_str = _pretty_json(val)
+                        _write_indented(w, val_str, 2)
                     else:
-                        lines.append(f"  {k}: {val}")
+                        w(f"  {k}: {val}\n")
             elif key in {"target_dirs", "exclude_paths", "omit_diff_paths"} and isinstance(value, list):
                 for item in value:
-                    lines.append(f"  - {item}")
+                    w(f"  - {item}\n")
             else:
                 if isinstance(value, (dict, list)):
-                    value_str = json.dumps(value, indent=2, ensure_ascii=False)
-                    lines.append(_indent_block(value_str, 2))
+                    value_str = _pretty_json(value)
+                    _write_indented(w, value_str, 2)
                 else:
-                    lines.append(f"  {value}")
-        lines.append("")
+                    w(f"  {value}\n")
+        w("\n")
 
-    lines.append("Main operation results:")
+    w("Main operation results:\n")
     for entry in data.get("main_operation_results", []):
-        line = f"- {entry.get('command', '')} (exit code {entry.get('return_code', 'N/A')})"
-        lines.append(line)
-        if entry.get("stdout"):
-            lines.append("  stdout:")
-            lines.append(_indent_block(str(entry["stdout"]), 4))
-        if entry.get("stderr"):
-            lines.append("  stderr:")
-            lines.append(_indent_block(str(entry["stderr"]), 4))
-    lines.append("")
+        get = entry.get
+        command = get("command", "")
+        return_code = get("return_code", "N/A")
+        stdout = get("stdout")
+        stderr = get("stderr")
+        w(f"- {command} (exit code {return_code})\n")
+        if stdout:
+            w("  stdout:\n")
+            _write_indented(w, str(stdout), 4)
+        if stderr:
+            w("  stderr:\n")
+            _write_indented(w, str(stderr), 4)
+    w("\n")
 
     diff_reports = data.get("diff_reports", {})
+    filesystem_rq = diff_reports.get("filesystem_rq", [])
+    filesystem_urn = diff_reports.get("filesystem_urN", [])
+    command_outputs = diff_reports.get("command_outputs", [])
 
-    lines.append("Filesystem diff (rq):")
-    for item in diff_reports.get("filesystem_rq", []):
-        lines.append(f"  - {item}")
-    lines.append("")
+    w("Filesystem diff (rq):\n")
+    for item in filesystem_rq:
+        w(f"  - {item}\n")
+    w("\n")
 
-    lines.append("Filesystem diff (urN):")
-    for item in diff_reports.get("filesystem_urN", []):
-        diff_lines = item.splitlines()
-        if not diff_lines:
+    w("Filesystem diff (urN):\n")
+    for item in filesystem_urn:
+        if not item:
             continue
-        lines.append(f"  - {diff_lines[0]}")
-        for diff_line in diff_lines[1:]:
-            lines.append(f"    {diff_line}")
-    lines.append("")
-
-    for entry in diff_reports.get("command_outputs", []):
-        lines.append(f"Command diff for: {entry.get('command', '')} (file: {entry.get('diff_file', '')})")
-        diff_content = entry.get("diff_content")
+        if _OTHER_LINE_BREAKS.search(item):
+            diff_lines = item.splitlines()
+            w(f"  - {diff_lines[0]}\n")
+            for diff_line in diff_lines[1:]:
+                w(f"    {diff_line}\n")
+            continue
+        if item.endswith("\n"):
+            item = item[:-1]
+        w("  - ")
+        w(item.replace("\n", "\n    "))
+        w("\n")
+    w("\n")
+
+    for entry in command_outputs:
+        get = entry.get
+        w(f"Command diff for: {get('command', '')} (file: {get('diff_file', '')})\n")
+        diff_content = get("diff_content")
         if diff_content:
-            lines.append(_indent_block(diff_content, 2))
+            _write_indented(w, diff_content, 2)
         else:
-            lines.append("  No diff content available.")
-        lines.append("")
-
-    return "\n".join(lines).rstrip() + "\n"
+            w("  No diff content available.\n")
+        w("\n")
@@ -1,8 +1,17 @@
+import io
+import json
 from pathlib import Path
 
 import pytest
 
-from envdiff.analysis import load_config
+from envdiff.analysis import (
+    _absolute_src_path,
+    _capture_command_outputs,
+    _copy_document,
+    _write_json,
+    load_config,
+    run_analysis,
+)
 
 
 def test_load_config_missing_file():
@@ -126,3 +135,149 @@ omit_diff_paths:
     assert result["exclude_paths"] == ["/a"]
     assert result["omit_diff_paths"] == ["b"]
 
+
+@pytest.fixture
+def yaml_loads(monkeypatch):
+    """Record the name of every file parsed by ``yaml.load`` in envdiff.analysis."""
+    import envdiff.analysis as analysis
+
+    calls = []
+    original = analysis.yaml.load
+
+    def counting_load(stream, Loader):
+        calls.append(stream.name)
+        return original(stream, Loader=Loader)
+
+    monkeypatch.setattr(analysis.yaml, "load", counting_load)
+    return calls
+
+
+def test_shared_extends_parsed_once(tmp_path: Path, yaml_loads) -> None:
+    (tmp_path / "base.yaml").write_text("target_dirs:\n  - /etc\nlist:\n  - 0\n")
+    (tmp_path / "a.yaml").write_text("extends: base.yaml\nlist:\n  - 1\n")
+    (tmp_path / "b.yaml").write_text("extends: base.yaml\nlist:\n  - 2\n")
+    child = tmp_path / "child.yaml"
+    child.write_text("extends: [a.yaml, b.yaml]\n")
+
+    result = load_config(child)
+
+    assert result == {"target_dirs": ["/etc"], "list": [0, 1, 0, 2]}
+    assert len(yaml_loads) == 4
+
+
+def test_unchanged_config_not_reparsed(tmp_path: Path, yaml_loads) -> None:
+    (tmp_path / "base.yaml").write_text("prepare:\n  copy_files:\n    - src: a\n      dest: /a\n")
+    child = tmp_path / "sub" / "child.yaml"
+    child.parent.mkdir()
+    child.write_text("extends: ../base.yaml\ntarget_dirs: [/etc]\n")
+
+    first = load_config(child)
+    first["target_dirs"].append("/mutated")
+    second = load_config(child)
+    assert len(yaml_loads) == 2
+    assert second == {"prepare": {"copy_files": [{"src": "../a", "dest": "/a"}]}, "target_dirs": ["/etc"]}
+
+    # Loading base.yaml directly resolves copy_files against its own directory.
+    assert load_config(tmp_path / "base.yaml")["prepare"]["copy_files"][0]["src"] == "a"
+    assert len(yaml_loads) == 2
+
+    child.write_text("extends: ../base.yaml\ntarget_dirs: [/var, /srv]\n")
+    assert load_config(child)["target_dirs"] == ["/var", "/srv"]
+    assert len(yaml_loads) == 3
+
+
+def test_shared_extends_nested_dicts_not_mutated(tmp_path: Path) -> None:
+    (tmp_path / "base.yaml").write_text("prepare:\n  commands:\n    - base\n")
+    (tmp_path / "a.yaml").write_text("extends: base.yaml\nprepare:\n  commands:\n    - a\n")
+    (tmp_path / "b.yaml").write_text("extends: base.yaml\nprepare:\n  commands:\n    - b\n")
+    child = tmp_path / "child.yaml"
+    child.write_text("extends: [a.yaml, b.yaml]\nprepare:\n  commands:\n    - c\n")
+
+    result = load_config(child)
+
+    assert result == {"prepare": {"commands": ["base", "a", "base", "b", "c"]}}
+
+
+def test_write_json_matches_json_dump() -> None:
+    data = {
+        "report_metadata": {"title": "Ünïcode \"quoted\""},
+        "definitions": {"target_dirs": ["/etc"], "prepare": {}, 1: "non-str key"},
+        "main_operation_results": [{"command": "true", "return_code": 0}],
+        "diff_reports": {"filesystem_rq": [], "filesystem_urN": ["a\n\tb"], "command_outputs": []},
+    }
+    buf = io.StringIO()
+
+    _write_json(buf, data)
+
+    assert buf.getvalue() == json.dumps(data, indent=4, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_write_json_escapes_strings_like_json(monkeypatch, use_orjson: bool) -> None:
+    import envdiff.analysis as analysis
+
+    if not use_orjson:
+        monkeypatch.setattr(analysis, "orjson", None)
+    data = {"lines": ["\x00\x1f\x7f\u2028 \\ \"", "\ud800", "日本語"]}
+    buf = io.StringIO()
+
+    _write_json(buf, data)
+
+    assert buf.getvalue() == json.dumps(data, indent=4, ensure_ascii=False)
+
+
+def test_duplicate_lists_deduped_across_extends(tmp_path: Path) -> None:
+    (tmp_path / "base.yaml").write_text("target_dirs: [/etc, /var]\nprepare:\n  commands: [a]\n")
+    child = tmp_path / "child.yaml"
+    child.write_text("extends: base.yaml\ntarget_dirs: [/var, /root, /etc]\nprepare:\n  commands: [a]\n")
+
+    result = load_config(child)
+
+    assert result["target_dirs"] == ["/etc", "/var", "/root"]
+    assert result["prepare"]["commands"] == ["a", "a"]
+
+
+def test_copy_document_is_deep(tmp_path: Path) -> None:
+    path = tmp_path / "config.yaml"
+    path.write_text("a: &x [1, {b: 2}]\nc: *x\nd: 2024-01-01\ne: !!set {f: null}\n")
+    document = load_config(path)
+    copied = _copy_document(document)
+    assert copied == document
+    copied["a"][1]["b"] = 3
+    copied["e"].add("g")
+    assert document["a"][1] == {"b": 2}
+    assert document["e"] == {"f"}
+
+
+def test_absolute_src_path(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "real.txt").write_text("x")
+    (tmp_path / "link.txt").symlink_to("dir/real.txt")
+    assert _absolute_src_path(Path("dir/./real.txt")) == tmp_path / "dir" / "real.txt"
+    assert _absolute_src_path(Path("link.txt")) == (tmp_path / "dir" / "real.txt").resolve()
+    assert _absolute_src_path(Path("dir/../link.txt")) == (tmp_path / "dir" / "real.txt").resolve()
+
+
+def test_run_analysis_rejects_invalid_exclude_paths(tmp_path: Path) -> None:
+    config = tmp_path / "config.yaml"
+    config.write_text("base_image: test\nexclude_paths: ['[unclosed']\n")
+
+    with pytest.raises(ValueError, match="exclude_paths"):
+        run_analysis(config, tmp_path / "report.json", "no-such-container-tool")
+
+
+def test_capture_command_outputs_serializes_shared_outfiles(tmp_path: Path) -> None:
+    calls = []
+
+    class FakeManager:
+        def capture_command_output(self, command, outfile):
+            calls.append((command, outfile.name))
+            outfile.write_text(command)
+
+    entries = [{"command": "first"}, {"command": "other"}, {"command": "last"}]
+    outfiles = [tmp_path / "same.txt", tmp_path / "other.txt", tmp_path / "same.txt"]
+
+    assert _capture_command_outputs(FakeManager(), entries, outfiles) == set(outfiles)
+    assert (tmp_path / "same.txt").read_text() == "last"
+    assert calls.index(("first", "same.txt")) < calls.index(("last", "same.txt"))
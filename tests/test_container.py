@@ -1,8 +1,20 @@
+import os
 import subprocess
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import pytest
 
-from envdiff.container import ContainerManager, DEFAULT_CONTAINER_TOOL
+from envdiff.container import (
+    ContainerManager,
+    DEFAULT_CONTAINER_TOOL,
+    _ShellSession,
+    _decode_output,
+    _encode_output,
+    _independent_destinations,
+)
 
 
 @pytest.fixture
@@ -21,3 +33,179 @@ def test_run_command_success(cm):
     assert result.returncode == 0
     assert result.stdout.strip() == "ok"
 
+
+def test_run_command_without_capture(cm):
+    result = cm._run_command(["sh", "-c", "echo ok; echo err >&2"], capture=False)
+    assert result.stdout is None
+    assert result.stderr.strip() == "err"
+
+
+@pytest.fixture
+def shell():
+    session = _ShellSession(["bash"])
+    yield session
+    session.close()
+
+
+def test_shell_session_run(shell):
+    assert shell.run("echo out; echo err >&2; exit 3") == (3, b"out\n", b"err\n")
+    assert shell.run("printf 'no newline'") == (0, b"no newline", b"")
+
+
+def test_shell_session_isolates_commands(shell):
+    shell.run("cd /; FOO=bar; exit 1")
+    returncode, stdout, _ = shell.run("cat; echo \"$FOO\"; pwd")
+    assert returncode == 0
+    assert stdout.decode().splitlines() == ["", os.getcwd()]
+
+
+def test_shell_session_keeps_background_output_with_its_command(shell):
+    returncode, stdout, _ = shell.run("(for i in 1 2 3; do echo bg$i; sleep 0.05; done) &")
+    assert (returncode, stdout) == (0, b"bg1\nbg2\nbg3\n")
+    for _ in range(3):
+        assert shell.run("sleep 0.06; echo mine") == (0, b"mine\n", b"")
+    shell.run("(for i in $(seq 200); do echo bg$i; echo err$i >&2; done) & echo started")
+    for _ in range(3):
+        assert shell.run("echo mine") == (0, b"mine\n", b"")
+
+
+def test_concurrent_exec_uses_separate_shell_sessions(cm, tmp_path):
+    cm._shell_argv = ["bash"]
+    # Each command registers its session shell's PID, then waits (bounded)
+    # until the other one has registered too, which requires two sessions.
+    pids = tmp_path / "pids"
+    command = (
+        f"echo $PPID >> {pids}; "
+        f"for _ in $(seq 500); do [ $(wc -l < {pids}) -ge 2 ] && break; sleep 0.01; done; "
+        "echo $PPID"
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(cm._exec, [command, command]))
+        assert [returncode for returncode, _, _ in results] == [0, 0]
+        session_pids = {stdout.strip() for _, stdout, _ in results}
+        assert len(session_pids) == 2
+        assert session_pids == set(pids.read_text().split())
+        assert cm._exec("echo three >&2") == (0, "", "three\n")
+        assert len(cm._shells) == 2
+        assert sorted(map(id, cm._idle_shells)) == sorted(map(id, cm._shells))
+    finally:
+        cm._close_shell()
+
+
+def test_background_output_stays_out_of_pooled_sessions(cm):
+    cm._shell_argv = ["bash"]
+    background = "(for i in $(seq 20); do echo bg$i; sleep 0.01; done) &"
+    commands = [background, "echo mine", "sleep 0.05; echo mine", "echo mine"]
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(cm._exec, commands))
+        assert results[0][1].split() == [f"bg{i}" for i in range(1, 21)]
+        assert results[1:] == [(0, "mine\n", "")] * 3
+        assert cm._exec("echo mine") == (0, "mine\n", "")
+    finally:
+        cm._close_shell()
+
+
+@pytest.mark.parametrize(
+    "data", [b"", b"plain\n", "café\n".encode(), b"a\r\nb\rc", b"bad \xff\xfe\n"]
+)
+def test_encode_output_matches_decoded_text(data):
+    assert _encode_output(data) == _decode_output(data).encode("utf-8")
+
+
+def test_exit_waits_for_background_cleanup(cm, monkeypatch):
+    done = []
+    monkeypatch.setattr(cm, "_cleanup", lambda: (time.sleep(0.1), done.append(True)))
+    cm.cleanup_in_background()
+    cm.cleanup_in_background()
+    cm.__exit__(None, None, None)
+    assert done == [True]
+
+
+@pytest.fixture
+def copy_cm(tmp_path, monkeypatch):
+    """A manager whose container tool copies into ``tmp_path / "root"`` on the host."""
+    root = tmp_path / "root"
+    root.mkdir()
+    tool = tmp_path / "tool"
+    tool.write_text(
+        "#!/bin/bash\n"
+        f"ROOT={root}\n"
+        'if [ "$2" = - ]; then tee "$ROOT.tar" | tar -x -C "$ROOT"; exit; fi\n'
+        'dest="$ROOT/${3#*:}"\n'
+        'if [ -d "$dest" ]; then cp -r "$2" "$dest/"; else cp -r "$2" "$dest"; fi\n'
+    )
+    tool.chmod(0o755)
+    manager = ContainerManager("image", str(tool))
+    manager.container_id = "cid"
+    manager._running = True
+    monkeypatch.setattr(
+        manager, "_dirs_in_container", lambda paths: [(root / p.lstrip("/")).is_dir() for p in paths]
+    )
+    return manager, root
+
+
+def test_copy_many_to_uses_one_tar_stream(copy_cm, tmp_path):
+    cm, root = copy_cm
+    (root / "etc").mkdir()
+    src = tmp_path / "src"
+    (src / "app").mkdir(parents=True)
+    (src / "app" / "main.py").write_text("main")
+    (src / "a.conf").write_text("a")
+    (src / "b.conf").write_text("b")
+
+    cm.copy_many_to([(src / "a.conf", "/etc"), (src / "b.conf", "/new/b.txt"), (src / "app", "/opt/app")])
+
+    assert (root / "etc" / "a.conf").read_text() == "a"
+    assert (root / "new" / "b.txt").read_text() == "b"
+    assert (root / "opt" / "app" / "main.py").read_text() == "main"
+    with tarfile.open(f"{root}.tar") as tar:
+        members = tar.getmembers()
+    assert {m.name for m in members} == {"etc/a.conf", "new/b.txt", "opt/app", "opt/app/main.py"}
+    assert all(m.uid == m.gid == 0 and m.uname == m.gname == "root" for m in members)
+
+
+def test_copy_many_to_keeps_order_of_overlapping_destinations(copy_cm, tmp_path):
+    cm, root = copy_cm
+    (root / "opt").mkdir()
+    src = tmp_path / "src"
+    (src / "app").mkdir(parents=True)
+    (src / "app" / "main.py").write_text("main")
+    (src / "cfg").write_text("cfg")
+
+    cm.copy_many_to([(src / "app", "/opt/app"), (src / "cfg", "/opt/app")])
+
+    assert (root / "opt" / "app" / "main.py").read_text() == "main"
+    assert (root / "opt" / "app" / "cfg").read_text() == "cfg"
+    assert not Path(f"{root}.tar").exists()
+
+
+def test_copy_many_to_copies_one_by_one_before_start(copy_cm, tmp_path):
+    cm, root = copy_cm
+    cm._running = False
+    (root / "etc").mkdir()
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.conf").write_text("a")
+    (src / "b.conf").write_text("b")
+
+    cm.copy_many_to([(src / "a.conf", "/etc"), (src / "b.conf", "/b.txt")])
+
+    assert (root / "etc" / "a.conf").read_text() == "a"
+    assert (root / "b.txt").read_text() == "b"
+    assert not Path(f"{root}.tar").exists()
+
+
+@pytest.mark.parametrize(
+    "dests, expected",
+    [
+        (["/etc", "/opt/app"], True),
+        (["/opt", "/opt-x", "/opt/y"], False),
+        (["/opt/app", "/opt/app"], False),
+        (["/", "/etc"], False),
+        (["/etc/", "/opt"], False),
+    ],
+)
+def test_independent_destinations(dests, expected):
+    assert _independent_destinations(dests, [os.path.normpath(d) for d in dests]) is expected
@@ -1,7 +1,15 @@
 import tempfile
 from pathlib import Path
 
-from envdiff.diff import generate_diff_report
+import pytest
+
+from envdiff.diff import (
+    generate_diff_report,
+    group_diff_sections,
+    iter_diff_report,
+    prune_excluded_files,
+    validate_exclude_paths,
+)
 
 
 def test_generate_diff_rq_and_urn():
@@ -56,6 +64,26 @@ def test_generate_diff_urn_with_omitted_paths():
         assert "+++ after/keep.txt" in output
 
 
+def test_omitted_paths_match_literally():
+    """Ensure omit_diff_paths are substrings, not regular expressions."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base_dir = Path(tmpdir) / "base"
+        after_dir = Path(tmpdir) / "after"
+        base_dir.mkdir()
+        after_dir.mkdir()
+
+        for name in ("a.txt", "abtxt"):
+            (base_dir / name).write_text("foo\n", encoding="utf-8")
+            (after_dir / name).write_text("bar\n", encoding="utf-8")
+
+        output = generate_diff_report(
+            base_dir, after_dir, "urN", omit_diff_paths=["a.txt", "(unused"]
+        )
+
+        assert "diff -urN base/a.txt after/a.txt (omitted)" in output
+        assert "--- base/abtxt" in output
+
+
 def test_generate_text_diff():
     """Ensure textual diff is produced for single files."""
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -70,3 +98,95 @@ def test_generate_text_diff():
         assert "---" in diff_output and "+++" in diff_output
         assert "-foo" in diff_output
         assert "+bar" in diff_output
+
+
+def test_group_diff_sections():
+    lines = [
+        "diff -urN base/a after/a",
+        "--- base/a",
+        "+++ after/a",
+        "@@ -1 +1 @@",
+        "-foo",
+        "+bar",
+        "Binary files base/b and after/b differ",
+    ]
+
+    assert group_diff_sections(lines) == [
+        "diff -urN base/a after/a\n--- base/a\n+++ after/a\n@@ -1 +1 @@\n-foo\n+bar",
+        "Binary files base/b and after/b differ",
+    ]
+    assert group_diff_sections([]) == []
+
+
+def test_group_diff_sections_from_iter_diff_report(tmp_path):
+    base_dir = tmp_path / "base"
+    after_dir = tmp_path / "after"
+    base_dir.mkdir()
+    after_dir.mkdir()
+    (base_dir / "a.txt").write_text("foo\n", encoding="utf-8")
+    (after_dir / "a.txt").write_text("bar\n", encoding="utf-8")
+    (after_dir / "b.txt").write_text("new\n", encoding="utf-8")
+
+    sections = group_diff_sections(iter_diff_report(base_dir, after_dir, "urN"))
+
+    assert sections == [
+        "diff -urN base/a.txt after/a.txt\n--- base/a.txt\n+++ after/a.txt\n@@ -1 +1 @@\n-foo\n+bar",
+        "diff -urN base/b.txt after/b.txt\n--- base/b.txt\n+++ after/b.txt\n@@ -0,0 +1 @@\n+new",
+    ]
+
+
+def test_iter_diff_report_matches_generate(tmp_path):
+    base_dir = tmp_path / "base"
+    after_dir = tmp_path / "after"
+    base_dir.mkdir()
+    after_dir.mkdir()
+    (base_dir / "common.txt").write_text("foo\n", encoding="utf-8")
+    (after_dir / "common.txt").write_text("bar\n", encoding="utf-8")
+    (after_dir / "new.txt").write_text("new\n", encoding="utf-8")
+
+    for diff_type in ("rq", "urN"):
+        lines = list(iter_diff_report(base_dir, after_dir, diff_type))
+        assert all("\n" not in line for line in lines)
+        assert "".join(line + "\n" for line in lines) == generate_diff_report(base_dir, after_dir, diff_type)
+
+
+def test_prune_excluded_files_keeps_reports(tmp_path):
+    """Excluded files are removed unless diff could still reach or report them."""
+    base_dir = tmp_path / "base"
+    after_dir = tmp_path / "after"
+    for root in (base_dir, after_dir):
+        (root / "log").mkdir(parents=True)
+        (root / "log" / "app.log").write_text(f"{root.name}\n", encoding="utf-8")
+        (root / "log" / "linked.log").write_text(f"{root.name}\n", encoding="utf-8")
+        (root / "log" / "x y.log").write_text(f"{root.name}\n", encoding="utf-8")
+        (root / "keep.txt").write_text(f"{root.name}\n", encoding="utf-8")
+    (after_dir / "latest").symlink_to("log/linked.log")
+    exclude = ["/log"]
+    before = [generate_diff_report(base_dir, after_dir, t, exclude) for t in ("rq", "urN")]
+
+    assert prune_excluded_files(base_dir, after_dir, exclude) == 1
+
+    assert not (base_dir / "log" / "app.log").exists()
+    assert not (after_dir / "log" / "app.log").exists()
+    assert (after_dir / "log" / "linked.log").exists()
+    assert (base_dir / "log" / "x y.log").exists()
+    assert [generate_diff_report(base_dir, after_dir, t, exclude) for t in ("rq", "urN")] == before
+
+
+def test_exclude_paths_posix_classes(tmp_path):
+    base_dir = tmp_path / "base"
+    after_dir = tmp_path / "after"
+    base_dir.mkdir()
+    after_dir.mkdir()
+    (after_dir / "log1").write_text("1\n", encoding="utf-8")
+    (after_dir / "logd").write_text("d\n", encoding="utf-8")
+
+    urn_output = generate_diff_report(base_dir, after_dir, "urN", ["/log[[:digit:]]"])
+
+    assert "after/logd" in urn_output
+    assert "log1" not in urn_output
+
+
+def test_invalid_exclude_path_names_entry():
+    with pytest.raises(ValueError, match=r"'/var/\(log'"):
+        validate_exclude_paths(["/tmp", "/var/(log"])
@@ -1,8 +1,11 @@
 
 from pathlib import Path
+import io
 import json
 
-from envdiff.report_formatter import json_report_to_text
+import pytest
+
+from envdiff.report_formatter import _write_indented, json_report_to_text
 
 
 def test_json_report_to_text(tmp_path: Path):
@@ -92,3 +95,87 @@ def test_definitions_order(tmp_path: Path):
 
     assert base_i < prepare_i < target_i < exclude_i < omit_i
 
+
+def test_json_report_to_text_cache_invalidated_on_change(tmp_path: Path):
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"report_metadata": {"title": "first"}}), encoding="utf-8")
+    assert "Title: first" in json_report_to_text(report)
+    assert json_report_to_text(report) is json_report_to_text(report)
+
+    report.write_text(json.dumps({"report_metadata": {"title": "second run"}}), encoding="utf-8")
+    assert "Title: second run" in json_report_to_text(report)
+
+
+def test_json_report_to_text_keeps_values_orjson_cannot_parse(tmp_path: Path):
+    report = tmp_path / "report.json"
+    report.write_text(
+        '{"definitions": {"big": 123456789012345678901234567890, "nan": NaN}}', encoding="utf-8"
+    )
+
+    text = json_report_to_text(report)
+
+    assert "- big:\n  123456789012345678901234567890" in text
+    assert "- nan:\n  nan" in text
+
+
+@pytest.mark.parametrize(
+    "number",
+    [
+        "9223372036854775807",
+        "-9223372036854775808",
+        "-9223372036854775809",
+        "18446744073709551615",
+        "18446744073709551616",
+    ],
+)
+def test_json_report_to_text_keeps_64_bit_bounds(tmp_path: Path, number: str):
+    report = tmp_path / "report.json"
+    report.write_text(f'{{"definitions": {{"n": {number}}}}}', encoding="utf-8")
+
+    assert f"- n:\n  {number}\n" in json_report_to_text(report)
+
+
+def test_json_report_to_text_lone_surrogate(tmp_path: Path):
+    report = tmp_path / "report.json"
+    report.write_text('{"definitions": {"x": ["\\ud800"]}}', encoding="utf-8")
+
+    text = json_report_to_text(report)
+
+    assert '- x:\n  [\n    "\ud800"\n  ]' in text
+
+
+@pytest.mark.parametrize("text", ["", "\n", "a", "a\nb\n", "a\n\nb", "a\r\nb\rc\x0cd\u2028e"])
+def test_write_indented_matches_splitlines(text: str):
+    out = io.StringIO()
+
+    _write_indented(out.write, text, 4)
+
+    assert out.getvalue() == "\n".join("    " + line for line in text.splitlines()) + "\n"
+
+
+def test_json_report_to_text_max_lines(tmp_path: Path):
+    report = tmp_path / "report.json"
+    content = "\n".join(f"+line{i}" for i in range(1000))
+    data = {"diff_reports": {"command_outputs": [{"command": "ls", "diff_file": "ls.txt", "diff_content": content}]}}
+    report.write_text(json.dumps(data), encoding="utf-8")
+
+    full = json_report_to_text(report)
+    text = json_report_to_text(report, max_lines=20)
+
+    assert text.endswith("\n... (truncated)\n")
+    assert text.splitlines()[:20] == full.splitlines()[:20]
+    assert len(text.splitlines()) == 21
+    assert json_report_to_text(report, max_lines=10000) == full
+
+
+def test_json_report_to_text_max_lines_boundary(tmp_path: Path):
+    report = tmp_path / "report.json"
+    data = {"diff_reports": {"command_outputs": [{"command": "ls", "diff_file": "ls.txt", "diff_content": "+a\n\n"}]}}
+    report.write_text(json.dumps(data), encoding="utf-8")
+
+    full = json_report_to_text(report)
+    lines = full.splitlines()
+
+    assert json_report_to_text(report, max_lines=len(lines)) == full
+    truncated = json_report_to_text(report, max_lines=len(lines) - 1)
+    assert truncated == "\n".join(lines[:-1]).rstrip() + "\n... (truncated)\n"